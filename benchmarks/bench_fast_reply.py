@@ -0,0 +1,88 @@
+"""
+Benchmark do motor de respostas rápidas: custo de matching por mensagem com 10k regras.
+
+Uso: python benchmarks/bench_fast_reply.py [--rules 10000] [--messages 20000]
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot_api.services.fast_reply import FastReplyEngine
+
+
+def random_word(rng: random.Random, min_len: int = 3, max_len: int = 10) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+
+def build_rules(rng: random.Random, total: int) -> list:
+    rules = []
+    for index in range(total):
+        keywords = [" ".join(random_word(rng) for _ in range(rng.randint(1, 3))) for _ in range(3)]
+        rules.append({
+            "id": f"regra_{index}",
+            "keywords": keywords,
+            "reply": f"Resposta {index}",
+            "exact": index % 10 == 0,
+            # Sem limite de palavras: o benchmark mede o custo do matching em mensagens longas
+            "max_words": 1000,
+        })
+    return rules
+
+
+def build_messages(rng: random.Random, rules: list, total: int, hit_ratio: float = 0.2) -> list:
+    messages = []
+    for _ in range(total):
+        words = [random_word(rng) for _ in range(rng.randint(3, 25))]
+        if rng.random() < hit_ratio:
+            rule = rng.choice(rules)
+            words.insert(rng.randint(0, len(words)), rng.choice(rule["keywords"]))
+        messages.append(" ".join(words))
+    return messages
+
+
+def naive_match(rules: list, message: str):
+    """Referência O(regras): testa cada palavra-chave individualmente."""
+    padded = f" {message} "
+    for rule in rules:
+        for keyword in rule["keywords"]:
+            if (rule.get("exact") and message == keyword) or (not rule.get("exact") and f" {keyword} " in padded):
+                return rule
+    return None
+
+
+def timed(label: str, func, messages: list):
+    started = time.perf_counter()
+    hits = sum(1 for message in messages if func(message) is not None)
+    elapsed = time.perf_counter() - started
+    per_message_us = elapsed / len(messages) * 1e6
+    print(f"{label:<16} {len(messages):>8} msgs  {elapsed:8.3f}s  {per_message_us:10.2f} µs/msg  hits={hits}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--naive-messages", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rules = build_rules(rng, args.rules)
+    messages = build_messages(rng, rules, args.messages)
+
+    engine = FastReplyEngine(rules_path=None)
+    started = time.perf_counter()
+    engine.load_rules(rules)
+    print(f"Compilação de {args.rules} regras: {time.perf_counter() - started:.3f}s")
+
+    timed("aho-corasick", engine.match, messages)
+    timed("ingênuo", lambda message: naive_match(rules, message), messages[:args.naive_messages])
+
+
+if __name__ == "__main__":
+    main()
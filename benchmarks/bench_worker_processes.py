@@ -0,0 +1,149 @@
+"""
+Benchmark do supervisor prefork: mensagens/s versus quantidade de processos.
+
+Requer um Redis local (REDIS_HOST/REDIS_PORT, padrão localhost:6379). O WAHA é
+substituído por um servidor HTTP stub que só conta os envios (com latência opcional).
+
+Usa um banco separado, BENCH_REDIS_DB (padrão 15; o banco 0 é recusado), e apaga
+apenas as chaves criadas pelo benchmark (chats "bench-*" e as filas de jobs).
+
+Uso: python benchmarks/bench_worker_processes.py [--processes 1,2,4,8] [--messages 2000] [--waha-latency-ms 20]
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import redis
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_JOBS_KEY = "queue:worker_jobs"
+BENCH_CHAT_PREFIX = "bench-"
+
+
+class StubWahaHandler(BaseHTTPRequestHandler):
+    """Responde como o WAHA e conta as mensagens enviadas."""
+    sent = 0
+    lock = threading.Lock()
+    latency = 0.0
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if self.path.endswith("/sendText"):
+            time.sleep(StubWahaHandler.latency)
+            with StubWahaHandler.lock:
+                StubWahaHandler.sent += 1
+        body = json.dumps({"id": "stub"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = _reply
+    do_PUT = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_waha() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWahaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def cleanup(r: redis.Redis):
+    """Remove somente o que o benchmark cria (não usa FLUSHDB)."""
+    keys = [WORKER_JOBS_KEY, "metrics:workers"]
+    for pattern in (f"{WORKER_JOBS_KEY}:processing:*", f"*:{BENCH_CHAT_PREFIX}*"):
+        keys.extend(r.scan_iter(match=pattern))
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.delete(key)
+    for chat_id in r.lrange("queue:support", 0, -1):
+        if chat_id.startswith(BENCH_CHAT_PREFIX):
+            pipe.lrem("queue:support", 0, chat_id)
+    pipe.execute()
+
+
+def run_round(r: redis.Redis, processes: int, messages: int, env: dict, timeout: float) -> float:
+    cleanup(r)
+    with StubWahaHandler.lock:
+        StubWahaHandler.sent = 0
+
+    supervisor = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, "workers", "supervisor.py"), "--processes", str(processes)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        # Espera todos os filhos estarem conectados antes de medir
+        time.sleep(2 + 0.2 * processes)
+        pipe = r.pipeline(transaction=False)
+        for i in range(messages):
+            pipe.rpush(WORKER_JOBS_KEY, f"{BENCH_CHAT_PREFIX}{i}@c.us")
+        started = time.perf_counter()
+        pipe.execute()
+
+        deadline = started + timeout
+        while StubWahaHandler.sent < messages:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"{StubWahaHandler.sent}/{messages} mensagens em {timeout}s")
+            time.sleep(0.01)
+        return messages / (time.perf_counter() - started)
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        supervisor.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", default=",".join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--waha-latency-ms", type=float, default=20)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    redis_host = os.getenv("REDIS_HOST", "localhost")
+    redis_port = int(os.getenv("REDIS_PORT", 6379))
+    redis_db = int(os.getenv("BENCH_REDIS_DB", 15))
+    if redis_db == 0:
+        sys.exit("BENCH_REDIS_DB=0 recusado: use um banco separado do usado pela aplicação.")
+    r = redis.Redis(host=redis_host, port=redis_port, db=redis_db, decode_responses=True)
+    r.ping()
+    if r.llen(WORKER_JOBS_KEY):
+        sys.exit(f"O banco {redis_db} já tem jobs em {WORKER_JOBS_KEY}: use um BENCH_REDIS_DB livre.")
+
+    StubWahaHandler.latency = args.waha_latency_ms / 1000
+    server = start_stub_waha()
+
+    env = dict(os.environ)
+    env.update({
+        "REDIS_HOST": redis_host,
+        "REDIS_PORT": str(redis_port),
+        "REDIS_DB": str(redis_db),
+        "WAHA_API_URL": f"http://127.0.0.1:{server.server_address[1]}",
+        "DJANGO_SECRET_KEY": env.get("DJANGO_SECRET_KEY", "bench"),
+        "DJANGO_SETTINGS_MODULE": "chatbot.settings",
+        "PYTHONPATH": ROOT_DIR,
+    })
+
+    print(f"{'processos':>9}  {'msgs/s':>10}  {'speedup':>8}")
+    baseline = None
+    for processes in (int(n) for n in args.processes.split(",")):
+        rate = run_round(r, processes, args.messages, env, args.timeout)
+        baseline = baseline or rate
+        print(f"{processes:>9}  {rate:>10.1f}  {rate / baseline:>7.2f}x")
+
+    cleanup(r)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,10 @@ class ChatbotApiConfig(AppConfig):
         """
         Método chamado quando o Django está totalmente inicializado.
         Inicia um thread para configurar o WAHA com HMAC.
+        Os Workers definem SKIP_WAHA_SESSION_SETUP: só o processo web configura a sessão.
         """
+        if os.environ.get("SKIP_WAHA_SESSION_SETUP"):
+            return
 
         def configure_waha_session():
             from .services.waha_api import Waha
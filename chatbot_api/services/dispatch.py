@@ -0,0 +1,43 @@
+import logging
+from chatbot_api.services.redis_client import (
+    get_session_state,
+    update_session_state,
+    enqueue_user,
+    is_user_in_queue,
+    publish_new_user,
+    claim_queue_dispatch
+)
+from chatbot_api.services.queue_broadcast import record_notified_position
+
+logger = logging.getLogger(__name__)
+
+
+def get_current_step(chat_id: str) -> str:
+    session_state = get_session_state(chat_id)
+    return session_state.get('step', 'INICIO') if session_state else 'INICIO'
+
+
+def dispatch_user_message(chat_id: str, waha, current_step: str = None) -> str:
+    """
+    Encaminha a mensagem do usuário (texto ou mídia já processada) conforme a etapa:
+    - EM_ATENDIMENTO: notifica o Worker para continuar a conversa.
+    - Fora da fila: entra na fila, recebe a posição e o Worker é notificado se for o primeiro.
+
+    :return: a etapa em que o usuário estava.
+    """
+    current_step = current_step or get_current_step(chat_id)
+
+    if current_step == "EM_ATENDIMENTO":
+        publish_new_user(chat_id) # Worker pega a mensagem e continua a conversa
+
+    elif not is_user_in_queue(chat_id):
+        queue_position = enqueue_user(chat_id)
+        resposta = f" Você está na fila. Posição: {queue_position}. Aguarde o atendimento."
+        waha.send_whatsapp_message(chat_id, resposta)
+        record_notified_position(chat_id, queue_position) # Base para o broadcast de posições
+        update_session_state(chat_id, step="IN_QUEUE") # Atualiza o estado
+        if queue_position == 1 and claim_queue_dispatch(chat_id):
+            publish_new_user(chat_id) # Notifica o worker para iniciar o processamento
+            logger.info("Worker notificado. Novo usuário é o primeiro.")
+
+    return current_step
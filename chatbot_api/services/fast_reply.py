@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import time
+import threading
+import logging
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fast_replies.json")
+RULES_PATH = os.environ.get("FAST_REPLY_RULES_PATH", DEFAULT_RULES_PATH)
+RELOAD_INTERVAL = float(os.environ.get("FAST_REPLY_RELOAD_INTERVAL", 5))
+# Regras não-exatas só valem para mensagens curtas (triviais); pode ser sobrescrito por regra
+DEFAULT_MAX_WORDS = int(os.environ.get("FAST_REPLY_MAX_WORDS", 4))
+
+# Índice compilado imutável: trocado por UMA atribuição, nunca campo a campo
+CompiledRules = namedtuple("CompiledRules", ["rules", "exact", "automaton", "max_words"])
+
+
+class KeywordAutomaton:
+    """
+    Índice multi-padrão Aho-Corasick: encontra TODAS as palavras-chave de uma
+    mensagem em uma única passada, custo O(tamanho da mensagem + ocorrências),
+    independente da quantidade de regras.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+    def add(self, keyword: str, value):
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((len(keyword), value))
+
+    def build(self):
+        """Calcula os links de falha (BFS). Deve ser chamado após todos os add()."""
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in self._goto[node].items():
+                pending.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        return self
+
+    def iter_matches(self, text: str):
+        """Gera (inicio, fim, value) para cada ocorrência; `fim` é exclusivo."""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, value in output[node]:
+                yield index - length + 1, index + 1, value
+
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_exact(text: str) -> str:
+    """Normaliza para a comparação exata: ignora pontuação e espaços extras ("Oi!!" -> "oi")."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _match_exact(exact: dict, message: str):
+    """
+    Índice da regra exata para a mensagem já normalizada. Também aceita uma sequência de
+    palavras-chave da MESMA regra ("olá bom dia" = "olá" + "bom dia").
+    """
+    index = exact.get(message)
+    if index is not None:
+        return index
+    words = message.split()
+    if len(words) < 2 or len(words) > DEFAULT_MAX_WORDS:
+        return None
+    # reachable[i]: regras cujas palavras-chave cobrem exatamente words[:i]
+    reachable = [set() for _ in range(len(words) + 1)]
+    for end in range(1, len(words) + 1):
+        for start in range(end):
+            index = exact.get(" ".join(words[start:end]))
+            if index is not None and (start == 0 or index in reachable[start]):
+                reachable[end].add(index)
+    return min(reachable[-1]) if reachable[-1] else None
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def validate_rules(rules) -> list:
+    """
+    Valida a lista de regras e a retorna.
+    Levanta ValueError descrevendo o primeiro problema encontrado.
+    """
+    if not isinstance(rules, list):
+        raise ValueError('"rules" deve ser uma lista')
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise ValueError(f"regra #{index} não é um objeto")
+        if not isinstance(rule.get("id"), str) or not rule["id"]:
+            raise ValueError(f'regra #{index} sem "id"')
+        if not isinstance(rule.get("reply"), str) or not rule["reply"].strip():
+            raise ValueError(f'regra "{rule["id"]}" sem "reply"')
+        keywords = rule.get("keywords")
+        if not isinstance(keywords, list) or not keywords or not all(isinstance(k, str) for k in keywords):
+            raise ValueError(f'regra "{rule["id"]}": "keywords" deve ser uma lista de textos')
+        max_words = rule.get("max_words", DEFAULT_MAX_WORDS)
+        if isinstance(max_words, bool) or not isinstance(max_words, int) or max_words < 1:
+            raise ValueError(f'regra "{rule["id"]}": "max_words" deve ser um inteiro positivo')
+    return rules
+
+
+class FastReplyEngine:
+    """
+    Motor de respostas rápidas baseado em regras.
+
+    Formato do arquivo (JSON):
+        {"rules": [{"id": "saudacao", "keywords": ["oi", "olá"], "reply": "...", "exact": true}]}
+
+    - `exact: true`: a mensagem inteira (sem pontuação) precisa ser igual à palavra-chave
+      ou a uma sequência de palavras-chave da mesma regra.
+    - caso contrário: a palavra-chave precisa aparecer como palavra inteira, e a
+      mensagem pode ter no máximo `max_words` palavras (padrão: FAST_REPLY_MAX_WORDS).
+    Em caso de múltiplas regras, vence a que aparece primeiro no arquivo.
+    """
+
+    def __init__(self, rules_path: str | None = RULES_PATH, reload_interval: float = RELOAD_INTERVAL):
+        self.rules_path = rules_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self._reloading = False
+        self._compiled = CompiledRules([], {}, KeywordAutomaton().build(), [])
+        self.maybe_reload(force=True)
+
+    def load_rules(self, rules: list):
+        """Valida e compila as regras; o índice novo substitui o anterior em uma única atribuição."""
+        rules = validate_rules(rules)
+        exact = {}
+        max_words = []
+        automaton = KeywordAutomaton()
+        for index, rule in enumerate(rules):
+            max_words.append(rule.get("max_words", DEFAULT_MAX_WORDS))
+            for keyword in rule["keywords"]:
+                if rule.get("exact"):
+                    keyword = normalize_exact(keyword)
+                    if keyword:
+                        exact.setdefault(keyword, index)
+                else:
+                    keyword = keyword.strip().lower()
+                    if keyword:
+                        automaton.add(keyword, index)
+        automaton.build()
+        self._compiled = CompiledRules(rules, exact, automaton, max_words)
+        logger.info(f"⚡ {len(rules)} regras de resposta rápida carregadas.")
+
+    def maybe_reload(self, force: bool = False):
+        """
+        Recarrega o arquivo de regras se ele mudou (checagem limitada a cada reload_interval).
+        O lock cobre só a checagem; a compilação roda em uma thread separada e as
+        regras antigas continuam respondendo até a troca.
+        """
+        if not self.rules_path:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_check < self.reload_interval:
+            return
+        with self._lock:
+            if not force and (self._reloading or now - self._last_check < self.reload_interval):
+                return
+            self._last_check = now
+            try:
+                mtime = os.stat(self.rules_path).st_mtime
+            except OSError:
+                if self._mtime is not None or force:
+                    logger.warning(f"Arquivo de respostas rápidas não encontrado: {self.rules_path}")
+                return
+            if mtime == self._mtime and not force:
+                return
+            # Marca a versão como vista mesmo se inválida, para não tentar recarregar a cada mensagem
+            self._mtime = mtime
+            self._reloading = True
+        if force:
+            self._reload_file()
+        else:
+            threading.Thread(target=self._reload_file, name="fast-reply-reload", daemon=True).start()
+
+    def _reload_file(self):
+        try:
+            with open(self.rules_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError('o arquivo deve ser um objeto com a lista "rules"')
+            self.load_rules(data.get("rules"))
+        except Exception as e:
+            # Mantém as regras anteriores se o arquivo novo estiver inválido
+            logger.error(f"❌ Erro ao carregar respostas rápidas de {self.rules_path}: {e}")
+        finally:
+            self._reloading = False
+
+    def match(self, message: str):
+        """
+        Retorna a regra (dict) correspondente à mensagem já normalizada
+        (`.strip().lower()`), ou None.
+        """
+        compiled = self._compiled
+        best = _match_exact(compiled.exact, normalize_exact(message)) if compiled.exact else None
+        word_count = None
+        for start, end, index in compiled.automaton.iter_matches(message):
+            if (best is not None and index >= best) or not _is_word_boundary(message, start, end):
+                continue
+            if word_count is None:
+                word_count = len(message.split())
+            if word_count > compiled.max_words[index]:
+                continue
+            best = index
+            if best == 0:
+                break
+        return compiled.rules[best] if best is not None else None
+
+
+_engine = None
+
+
+def get_fast_reply_engine() -> FastReplyEngine:
+    """Singleton lazy por processo, com hot-reload do arquivo de regras."""
+    global _engine
+    if _engine is None:
+        _engine = FastReplyEngine()
+    _engine.maybe_reload()
+    return _engine
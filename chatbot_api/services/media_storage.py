@@ -0,0 +1,83 @@
+import os
+import hashlib
+import tempfile
+import logging
+from importlib import import_module
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "media_storage")
+MEDIA_STORAGE_DIR = os.environ.get("MEDIA_STORAGE_DIR", DEFAULT_STORAGE_DIR)
+MEDIA_MAX_BYTES = int(os.environ.get("MEDIA_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class MediaTooLargeError(Exception):
+    """A mídia ultrapassou MEDIA_MAX_BYTES durante o download."""
+
+
+class LocalMediaStorage:
+    """
+    Armazenamento local no estilo "object storage": cada arquivo é gravado
+    com a chave `<sha256[:2]>/<sha256>`, então conteúdos idênticos são
+    deduplicados automaticamente.
+    """
+
+    def __init__(self, base_dir: str = MEDIA_STORAGE_DIR, max_bytes: int = MEDIA_MAX_BYTES):
+        self.base_dir = base_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(self.base_dir, "tmp"), exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.base_dir, key)
+
+    def put_stream(self, chunks) -> tuple:
+        """
+        Grava um iterável de blocos de bytes calculando o hash em paralelo.
+        A memória usada é limitada ao tamanho de um bloco.
+
+        :return: (key, tamanho_em_bytes, deduplicado)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.base_dir, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise MediaTooLargeError(f"Mídia maior que {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+
+            sha = digest.hexdigest()
+            key = f"{sha[:2]}/{sha}"
+            final_path = self.path_for(key)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                logger.info(f"♻️ Mídia {sha[:12]} já armazenada. Reutilizando.")
+                return key, size, True
+
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            return key, size, False
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def load_transcriber():
+    """
+    Carrega o backend de transcrição configurado em MEDIA_TRANSCRIBER
+    ("modulo.caminho:funcao"). A função recebe (caminho_arquivo, mimetype)
+    e retorna o texto. Sem configuração, a transcrição é desativada.
+    """
+    target = os.environ.get("MEDIA_TRANSCRIBER")
+    if not target:
+        return None
+    module_name, _, func_name = target.partition(":")
+    try:
+        return getattr(import_module(module_name), func_name)
+    except (ImportError, AttributeError) as e:
+        logger.error(f"❌ Backend de transcrição inválido '{target}': {e}")
+        return None
@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+from chatbot_api.services.redis_client import get_redis_client, get_session_key, QUEUE_KEY
+
+logger = logging.getLogger(__name__)
+
+# --- Chaves de Redis ---
+# Hash chat_id -> "posicao|timestamp" da última posição informada ao usuário
+POSITION_STATE_KEY = "queue:position_notified"
+
+# --- Configuração (via ambiente) ---
+BROADCAST_INTERVAL = float(os.environ.get("QUEUE_BROADCAST_INTERVAL", 15))
+USER_MIN_INTERVAL = float(os.environ.get("QUEUE_BROADCAST_USER_INTERVAL", 300))
+POSITION_THRESHOLDS = sorted(
+    int(t) for t in os.environ.get("QUEUE_BROADCAST_THRESHOLDS", "1,2,3,5,10,20,50").split(",") if t.strip()
+)
+WAHA_SEND_RATE = float(os.environ.get("WAHA_SEND_RATE", 1.0))  # mensagens por segundo
+MAX_SENDS_PER_CYCLE = int(os.environ.get("QUEUE_BROADCAST_MAX_SENDS", 50))
+
+
+def format_position_message(position: int) -> str:
+    return f" Sua posição na fila foi atualizada: {position}. Aguarde o atendimento."
+
+
+def record_notified_position(chat_id: str, position: int, now: float = None):
+    """Registra a última posição informada ao usuário (ex.: no momento do enqueue)."""
+    r = get_redis_client()
+    now = time.time() if now is None else now
+    r.hset(POSITION_STATE_KEY, chat_id, f"{position}|{now}")
+
+
+def compute_positions(queue: list) -> dict:
+    """
+    Calcula a posição (1-based) de cada chat_id em UMA passada pela fila.
+    Em caso de duplicatas vale a primeira ocorrência (mesma semântica do LPOS).
+    """
+    positions = {}
+    for index, chat_id in enumerate(queue, start=1):
+        positions.setdefault(chat_id, index)
+    return positions
+
+
+def _parse_state(raw: str):
+    """Converte "posicao|timestamp" em (posicao, timestamp). Valores inválidos viram (None, 0)."""
+    try:
+        position, ts = raw.split("|", 1)
+        return int(position), float(ts)
+    except (AttributeError, ValueError):
+        return None, 0.0
+
+
+def should_notify(new_position: int, last_position, last_ts: float, now: float) -> bool:
+    """
+    Regras de throttle por usuário:
+    - Sem estado salvo, não notifica (a posição atual vira a base, sem mensagem).
+    - Só notifica se a posição AVANÇOU (diminuiu).
+    - Notifica imediatamente ao cruzar um limiar (ex.: chegou ao top 5).
+    - Caso contrário, notifica no máximo uma vez a cada USER_MIN_INTERVAL segundos.
+    """
+    if last_position is None:
+        return False
+    if new_position >= last_position:
+        return False
+    if any(new_position <= t < last_position for t in POSITION_THRESHOLDS):
+        return True
+    return (now - last_ts) >= USER_MIN_INTERVAL
+
+
+class RateLimiter:
+    """Limitador simples (intervalo mínimo entre envios) para respeitar o rate limit do WAHA."""
+
+    def __init__(self, rate_per_second: float):
+        self.min_gap = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._last = 0.0
+
+    def wait(self):
+        elapsed = time.monotonic() - self._last
+        if elapsed < self.min_gap:
+            time.sleep(self.min_gap - elapsed)
+        self._last = time.monotonic()
+
+
+def run_broadcast_cycle(waha, rate_limiter: RateLimiter = None, now: float = None) -> int:
+    """
+    Executa um ciclo de broadcast de posições. Custo O(fila):
+    1 HGETALL + 1 LRANGE + 1 pipeline de HGET (etapa da sessão) para leitura,
+    1 pipeline para gravar o novo estado.
+
+    :return: quantidade de notificações enviadas.
+    """
+    r = get_redis_client()
+    now = time.time() if now is None else now
+    rate_limiter = rate_limiter or RateLimiter(WAHA_SEND_RATE)
+
+    # O estado é lido ANTES da fila: quem entrou entre as duas leituras aparece
+    # na fila sem estado (vira base silenciosa) em vez de ser tratado como "saiu da fila"
+    state = r.hgetall(POSITION_STATE_KEY)
+    queue = r.lrange(QUEUE_KEY, 0, -1)
+    positions = compute_positions(queue)
+
+    pipe = r.pipeline(transaction=False)
+    for chat_id in positions:
+        pipe.hget(get_session_key(chat_id), "step")
+    steps = dict(zip(positions, pipe.execute()))
+
+    pending = []
+    baseline = {}
+    for chat_id, position in positions.items():
+        if steps.get(chat_id) == "EM_ATENDIMENTO":
+            continue
+        last_position, last_ts = _parse_state(state.get(chat_id))
+        if last_position is None:
+            baseline[chat_id] = f"{position}|{now}"
+        elif should_notify(position, last_position, last_ts, now):
+            pending.append((position, chat_id))
+
+    # Prioriza quem está mais perto do atendimento e limita os envios do ciclo
+    pending.sort()
+    to_send = pending[:MAX_SENDS_PER_CYCLE]
+    if len(pending) > len(to_send):
+        logger.info(f"⏳ {len(pending) - len(to_send)} notificações adiadas para o próximo ciclo.")
+
+    if baseline:
+        pipe.hset(POSITION_STATE_KEY, mapping=baseline)
+
+    sent = 0
+    for position, chat_id in to_send:
+        rate_limiter.wait()
+        if waha.send_whatsapp_message(chat_id, format_position_message(position)) is None:
+            continue
+        pipe.hset(POSITION_STATE_KEY, chat_id, f"{position}|{now}")
+        sent += 1
+
+    # Remove o estado de quem já saiu da fila
+    stale = [chat_id for chat_id in state if chat_id not in positions]
+    if stale:
+        pipe.hdel(POSITION_STATE_KEY, *stale)
+
+    pipe.execute()
+    logger.info(f"📢 Broadcast de posições: fila={len(positions)} enviados={sent} base={len(baseline)} removidos={len(stale)}")
+    return sent
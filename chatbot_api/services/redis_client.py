@@ -1,3 +1,4 @@
+import os
 import redis
 import json
 from django.conf import settings
@@ -41,6 +42,14 @@ def get_redis_client():
         raise ConnectionError(f"Falha na inicialização do cliente Redis: {e}") 
 
 
+def _reset_redis_client_after_fork():
+    """Descarta a conexão herdada do processo pai (sockets não podem ser compartilhados entre processos)."""
+    global _redis_client
+    _redis_client = None
+
+os.register_at_fork(after_in_child=_reset_redis_client_after_fork)
+
+
 # --- Chaves de Redis (Permanecem iguais) ---
 QUEUE_KEY = "queue:support"
 
@@ -59,6 +68,44 @@ def is_user_in_queue(chat_id: str) -> bool:
     r = get_redis_client() # <<< OBTÉM A CONEXÃO AQUI
     return chat_id in set(r.lrange(QUEUE_KEY, 0, -1))
 
+QUEUE_DISPATCH_TTL = 3600
+
+def get_queue_dispatched_key(chat_id: str) -> str:
+    return f"queue:dispatched:{chat_id}"
+
+# Remove o usuário da fila e, de forma atômica, devolve o novo primeiro da fila
+# apenas se ele ainda não foi entregue ao Worker (marcador SET NX).
+_REMOVE_AND_CLAIM_HEAD = """
+local removed = redis.call('lrem', KEYS[1], 0, ARGV[1])
+redis.call('del', ARGV[2] .. ARGV[1])
+if removed == 0 then
+    return false
+end
+local head = redis.call('lindex', KEYS[1], 0)
+if head and redis.call('set', ARGV[2] .. head, 1, 'NX', 'EX', ARGV[3]) then
+    return head
+end
+return false
+"""
+
+def claim_queue_dispatch(chat_id: str) -> bool:
+    """Marca o usuário da fila como entregue ao Worker. Retorna False se já estava marcado."""
+    r = get_redis_client()
+    return bool(r.set(get_queue_dispatched_key(chat_id), 1, nx=True, ex=QUEUE_DISPATCH_TTL))
+
+def remove_user_from_queue(chat_id: str) -> str:
+    """
+    Remove o chat_id da fila de espera (ex.: quando o Worker inicia o atendimento).
+
+    :return: o novo primeiro da fila, que deve ser entregue ao Worker, ou None
+             (fila vazia, usuário não estava na fila ou o próximo já foi entregue).
+    """
+    r = get_redis_client()
+    next_chat_id = r.eval(_REMOVE_AND_CLAIM_HEAD, 1, QUEUE_KEY, chat_id, get_queue_dispatched_key(""), QUEUE_DISPATCH_TTL)
+    if next_chat_id:
+        logger.info(f"Usuário {chat_id} removido da fila de espera. Próximo: {next_chat_id}")
+    return next_chat_id or None
+
 def get_next_from_queue() -> str:
     """Remove e retorna o próximo usuário da fila (BLOCKING)"""
     r = get_redis_client()
@@ -72,12 +119,153 @@ def get_next_from_queue() -> str:
 
 # --- Funções Pub/Sub para Comunicação com Worker ---
 
+WORKER_JOBS_KEY = "queue:worker_jobs"
+CHAT_LOCK_TTL = int(os.environ.get("WORKER_CHAT_LOCK_TTL", 300))
+
+# Compare-and-delete: só remove a chave se ela ainda pertence a quem está liberando
+_RELEASE_IF_OWNER = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 def publish_new_user(chat_id: str):
-    """Publica notificação de novo usuário na fila via Redis Pub/Sub"""
+    """
+    Entrega o chat_id para os Workers e publica a notificação via Redis Pub/Sub.
+    O job vai para uma lista (consumida com BLMOVE) para que, com vários processos
+    de Worker, cada notificação seja processada por exatamente UM deles.
+    """
     r = get_redis_client()
-    r.publish("new_user_queue", chat_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.rpush(WORKER_JOBS_KEY, chat_id)
+    pipe.publish("new_user_queue", chat_id)
+    pipe.execute()
     logger.info(f"📢 Notificação Pub/Sub enviada para usuário {chat_id}")
 
+def get_processing_key(consumer_id: str) -> str:
+    return f"{WORKER_JOBS_KEY}:processing:{consumer_id}"
+
+def get_next_worker_job(consumer_id: str, timeout: int = 1) -> str:
+    """
+    Move o próximo chat_id para a lista de processamento do consumidor (BLOCKING).
+    Se o processo morrer antes do ack, o supervisor devolve o job para a fila.
+    """
+    r = get_redis_client()
+    # timeout precisa ser menor que o socket_timeout do cliente
+    return r.blmove(WORKER_JOBS_KEY, get_processing_key(consumer_id), timeout, "LEFT", "RIGHT")
+
+def ack_worker_job(consumer_id: str, chat_id: str):
+    """Confirma o job: remove o chat_id da lista de processamento do consumidor."""
+    r = get_redis_client()
+    r.lrem(get_processing_key(consumer_id), 1, chat_id)
+
+def get_chat_lock_key(chat_id: str) -> str:
+    return f"lock:chat:{chat_id}"
+
+def get_chat_pending_key(chat_id: str) -> str:
+    return f"pending:chat:{chat_id}"
+
+def acquire_chat_lock(chat_id: str, owner: str) -> bool:
+    """Garante que apenas UM processo atende o chat por vez (SET NX PX)."""
+    r = get_redis_client()
+    return bool(r.set(get_chat_lock_key(chat_id), owner, nx=True, px=CHAT_LOCK_TTL * 1000))
+
+def release_chat_lock(chat_id: str, owner: str) -> bool:
+    r = get_redis_client()
+    return bool(r.eval(_RELEASE_IF_OWNER, 1, get_chat_lock_key(chat_id), owner))
+
+def mark_chat_pending(chat_id: str):
+    """Avisa o dono do lock que chegaram novas mensagens enquanto ele processava."""
+    r = get_redis_client()
+    r.set(get_chat_pending_key(chat_id), 1, ex=CHAT_LOCK_TTL)
+
+def clear_chat_pending(chat_id: str):
+    r = get_redis_client()
+    r.delete(get_chat_pending_key(chat_id))
+
+def has_chat_pending(chat_id: str) -> bool:
+    r = get_redis_client()
+    return r.exists(get_chat_pending_key(chat_id)) > 0
+
+# --- Funções de Mídia (apenas metadados passam pelo Redis) ---
+
+MEDIA_QUEUE_KEY = "queue:media"
+
+def enqueue_media_job(chat_id: str, message_id: str, media: dict, dispatch: bool = True) -> int:
+    """
+    Registra os metadados de uma mídia recebida para o Worker de mídia baixar depois.
+    Com `dispatch=True` o Worker de mídia encaminha o usuário (fila/atendimento) após processar.
+    """
+    r = get_redis_client()
+    job = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "url": media.get("url"),
+        "mimetype": media.get("mimetype"),
+        "filename": media.get("filename"),
+        "dispatch": dispatch,
+    }
+    new_size = r.rpush(MEDIA_QUEUE_KEY, json.dumps(job))
+    logger.info(f"📎 Mídia {message_id} de {chat_id} registrada ({job['mimetype']}).")
+    return new_size
+
+def get_media_processing_key(consumer_id: str) -> str:
+    return f"{MEDIA_QUEUE_KEY}:processing:{consumer_id}"
+
+def get_next_media_job(consumer_id: str, timeout: int = 1) -> str:
+    """
+    Move o próximo job de mídia para a lista de processamento do consumidor (BLOCKING).
+    Retorna o JSON do job como está na fila: o mesmo texto é usado no ack.
+    """
+    r = get_redis_client()
+    # timeout precisa ser menor que o socket_timeout do cliente
+    return r.blmove(MEDIA_QUEUE_KEY, get_media_processing_key(consumer_id), timeout, "LEFT", "RIGHT")
+
+def ack_media_job(consumer_id: str, raw_job: str):
+    """Confirma o job de mídia: remove-o da lista de processamento do consumidor."""
+    r = get_redis_client()
+    r.lrem(get_media_processing_key(consumer_id), 1, raw_job)
+
+def recover_media_jobs(hostname: str) -> int:
+    """
+    Na inicialização do Worker de mídia: devolve para o início da fila os jobs que
+    uma execução anterior neste host não confirmou (processo morto no meio do download).
+    """
+    r = get_redis_client()
+    recovered = 0
+    for key in r.scan_iter(match=get_media_processing_key(f"{hostname}:*")):
+        while r.lmove(key, MEDIA_QUEUE_KEY, "RIGHT", "LEFT") is not None:
+            recovered += 1
+    if recovered:
+        logger.warning(f"♻️ {recovered} job(s) de mídia devolvidos para a fila.")
+    return recovered
+
+def get_media_key(message_id: str) -> str:
+    return f"media:{message_id}"
+
+def save_media_record(message_id: str, ttl_seconds: int = 7 * 24 * 3600, **fields):
+    """Salva o resultado da ingestão (hash do conteúdo, caminho, transcrição...)."""
+    r = get_redis_client()
+    key = get_media_key(message_id)
+    r.hset(key, mapping={field: str(value) for field, value in fields.items()})
+    r.expire(key, ttl_seconds)
+
+def get_media_transcription_key(sha256: str) -> str:
+    return f"media:sha:{sha256}"
+
+def get_media_transcription(sha256: str) -> str:
+    """Transcrição já feita para um conteúdo (mesmo hash), ou None."""
+    r = get_redis_client()
+    return r.hget(get_media_transcription_key(sha256), "transcription")
+
+def save_media_transcription(sha256: str, text: str, ttl_seconds: int = 30 * 24 * 3600):
+    """Guarda a transcrição pelo hash do conteúdo: áudios repetidos não são transcritos de novo."""
+    r = get_redis_client()
+    key = get_media_transcription_key(sha256)
+    r.hset(key, "transcription", text)
+    r.expire(key, ttl_seconds)
+
 # --- Funções de Histórico (Todas devem usar get_redis_client()) ---
 
 def get_history_key(chat_id: str) -> str:
@@ -128,6 +316,19 @@ def set_session_ttl(chat_id: str, ttl_seconds: int = 3600):
     r.expire(get_session_key(chat_id), ttl_seconds)
     logger.info(f"TTL de {ttl_seconds}s definido para sessão de {chat_id}")
 
+# --- Métricas de Respostas Rápidas ---
+FAST_REPLY_HITS_KEY = "metrics:fast_reply_hits"
+
+def record_fast_reply_hit(rule_id: str) -> int:
+    """Incrementa o contador de acertos da regra de resposta rápida."""
+    r = get_redis_client()
+    return r.hincrby(FAST_REPLY_HITS_KEY, rule_id, 1)
+
+def get_fast_reply_hits() -> dict:
+    """Retorna os acertos por regra ({rule_id: total})."""
+    r = get_redis_client()
+    return {rule_id: int(total) for rule_id, total in r.hgetall(FAST_REPLY_HITS_KEY).items()}
+
 #MESSAGE_DUPLICATE:
 
 def check_and_set_message_id(message_id: str) -> bool:
@@ -2,6 +2,7 @@ import os
 import requests
 import json
 import logging
+from urllib.parse import urlsplit
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +12,7 @@ class Waha():
         self.__api_url = os.environ.get("WAHA_API_URL", "http://waha:3000")
         self.waha_api_chave = os.environ.get("WAHA_API_KEY") 
         self.waha_instance = os.environ.get("WAHA_INSTANCE_KEY", "default")
+        self.timeout = float(os.environ.get("WAHA_TIMEOUT", 30))
 
     def send_whatsapp_message(self, chat_id, message):
         url = f"{self.__api_url}/api/sendText"
@@ -34,7 +36,8 @@ class Waha():
             response = requests.post(
                 url, 
                 headers=headers, 
-                data=json.dumps(payload)
+                data=json.dumps(payload),
+                timeout=self.timeout
             )
             response.raise_for_status() 
             
@@ -48,6 +51,37 @@ class Waha():
             return None
 
 
+    def internal_media_url(self, media_url: str) -> str:
+        """
+        O WAHA monta a URL da mídia com o WAHA_BASE_URL dele (padrão: localhost:3000),
+        que não é acessível de outros containers. Usa só o caminho e reaproveita o
+        WAHA_API_URL, assim a X-Api-Key nunca é enviada para outro host.
+        """
+        parts = urlsplit(media_url or "")
+        if not parts.path.startswith("/api/"):
+            raise ValueError(f"URL de mídia inesperada: {media_url}")
+        query = f"?{parts.query}" if parts.query else ""
+        return f"{self.__api_url.rstrip('/')}{parts.path}{query}"
+
+    def stream_media(self, media_url: str, chunk_size: int = 64 * 1024):
+        """
+        Faz o download de uma mídia do WAHA em STREAMING, gerando blocos de
+        `chunk_size` bytes. O arquivo nunca é carregado inteiro na memória.
+        """
+        url = self.internal_media_url(media_url)
+        headers = {
+            'X-Api-Key': self.waha_api_chave
+        }
+
+        with requests.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 401:
+                logger.error("ERRO 401: Verifique se o WAHA_API_KEY está correto.")
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    yield chunk
+
+
     def start_session_with_hmac(self, hmac_key: str):
         """
         USA PUT /api/sessions/{session} para reconfigurar o webhook,
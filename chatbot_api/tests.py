@@ -1,3 +1,275 @@
-from django.test import TestCase
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from chatbot_api.services import queue_broadcast
+from chatbot_api.services.queue_broadcast import compute_positions, should_notify, RateLimiter, POSITION_STATE_KEY
+from chatbot_api.services.fast_reply import KeywordAutomaton, FastReplyEngine
+from chatbot_api.services.media_storage import LocalMediaStorage, MediaTooLargeError
+from chatbot_api.services.waha_api import Waha
+
+# O supervisor é um script em workers/ (fora de um pacote)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "workers"))
+import supervisor  # noqa: E402
+
+
+class QueuePositionTests(SimpleTestCase):
+
+    def test_compute_positions_uses_first_occurrence(self):
+        positions = compute_positions(["a", "b", "a", "c"])
+        self.assertEqual(positions, {"a": 1, "b": 2, "c": 4})
+
+    def test_should_notify_without_state_is_silent(self):
+        self.assertFalse(should_notify(3, None, 0.0, now=1000.0))
+
+    def test_should_notify_only_when_position_advances(self):
+        self.assertFalse(should_notify(7, 7, 0.0, now=10_000.0))
+        self.assertFalse(should_notify(8, 7, 0.0, now=10_000.0))
+
+    def test_should_notify_when_crossing_threshold(self):
+        # 6 -> 5 cruza o limiar 5 mesmo dentro do intervalo mínimo
+        self.assertTrue(should_notify(5, 6, 999.0, now=1000.0))
+
+    def test_should_notify_throttles_between_thresholds(self):
+        # 40 -> 39 não cruza limiar: depende do intervalo mínimo por usuário
+        self.assertFalse(should_notify(39, 40, 999.0, now=1000.0))
+        self.assertTrue(should_notify(39, 40, 0.0, now=1000.0))
+
+
+class BroadcastCycleTests(SimpleTestCase):
+
+    NOW = 10_000.0
+
+    def setUp(self):
+        self.redis = mock.Mock()
+        self.pipe = self.redis.pipeline.return_value
+        patcher = mock.patch.object(queue_broadcast, "get_redis_client", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.waha = mock.Mock()
+        self.waha.send_whatsapp_message.return_value = {"id": "ok"}
+
+    def run_cycle(self, state: dict, queue: list, steps: list) -> int:
+        self.redis.hgetall.return_value = state
+        self.redis.lrange.return_value = queue
+        self.pipe.execute.side_effect = [steps, []]
+        return queue_broadcast.run_broadcast_cycle(self.waha, rate_limiter=RateLimiter(0), now=self.NOW)
+
+    def sent_to(self) -> list:
+        return [c.args[0] for c in self.waha.send_whatsapp_message.call_args_list]
+
+    def test_new_users_get_silent_baseline(self):
+        sent = self.run_cycle({}, ["a", "b"], [None, None])
+        self.assertEqual(sent, 0)
+        self.waha.send_whatsapp_message.assert_not_called()
+        self.pipe.hset.assert_called_once_with(
+            POSITION_STATE_KEY, mapping={"a": f"1|{self.NOW}", "b": f"2|{self.NOW}"}
+        )
+
+    def test_users_in_service_are_skipped(self):
+        sent = self.run_cycle({"a": "3|0", "b": "3|0"}, ["a", "b"], ["EM_ATENDIMENTO", None])
+        self.assertEqual(sent, 1)
+        self.assertEqual(self.sent_to(), ["b"])
+
+    def test_stale_state_is_removed(self):
+        self.run_cycle({"a": "2|0", "gone": "1|0"}, ["a"], [None])
+        self.pipe.hdel.assert_called_once_with(POSITION_STATE_KEY, "gone")
+
+    def test_sends_are_capped_closest_first(self):
+        state = {chat_id: "9|0" for chat_id in "abc"}
+        with mock.patch.object(queue_broadcast, "MAX_SENDS_PER_CYCLE", 2):
+            sent = self.run_cycle(state, ["a", "b", "c"], [None, None, None])
+        self.assertEqual(sent, 2)
+        self.assertEqual(self.sent_to(), ["a", "b"])
+
+    def test_failed_send_keeps_previous_state(self):
+        self.waha.send_whatsapp_message.side_effect = lambda chat_id, text: None if chat_id == "a" else {"id": "ok"}
+        sent = self.run_cycle({"a": "3|0", "b": "3|0"}, ["a", "b"], [None, None])
+        self.assertEqual(sent, 1)
+        self.pipe.hset.assert_called_once_with(POSITION_STATE_KEY, "b", f"2|{self.NOW}")
+
+
+class KeywordAutomatonTests(SimpleTestCase):
+
+    def test_finds_overlapping_keywords(self):
+        automaton = KeywordAutomaton()
+        for value, keyword in enumerate(["he", "she", "his", "hers"]):
+            automaton.add(keyword, value)
+        automaton.build()
+        matches = sorted(automaton.iter_matches("ushers"))
+        self.assertEqual(matches, [(1, 4, 1), (2, 4, 0), (2, 6, 3)])
+
+    def test_empty_automaton_has_no_matches(self):
+        self.assertEqual(list(KeywordAutomaton().build().iter_matches("qualquer texto")), [])
+
+
+class FastReplyEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.engine = FastReplyEngine(rules_path=None)
+        self.engine.load_rules([
+            {"id": "saudacao", "keywords": ["oi", "olá", "Bom dia"], "reply": "Olá!", "exact": True},
+            {"id": "horario", "keywords": ["horário"], "reply": "8h às 18h", "max_words": 4},
+            {"id": "endereco", "keywords": ["endereço"], "reply": "Rua X"},
+        ])
+
+    def test_exact_rule_requires_whole_message(self):
+        self.assertEqual(self.engine.match("oi")["id"], "saudacao")
+        self.assertIsNone(self.engine.match("oi tudo bem"))
+
+    def test_exact_rule_ignores_punctuation(self):
+        self.assertEqual(self.engine.match("oi!")["id"], "saudacao")
+        self.assertEqual(self.engine.match("bom dia!")["id"], "saudacao")
+        self.assertEqual(self.engine.match("olá, bom dia")["id"], "saudacao")
+        self.assertIsNone(self.engine.match("oi, preciso de ajuda"))
+
+    def test_keyword_must_be_whole_word(self):
+        self.assertIsNone(self.engine.match("noite"))
+        self.assertEqual(self.engine.match("qual o horário?")["id"], "horario")
+
+    def test_long_messages_are_not_fast_replied(self):
+        self.assertIsNone(self.engine.match("preciso remarcar meu horário de consulta amanhã"))
+
+    def test_first_rule_in_file_wins(self):
+        self.assertEqual(self.engine.match("horário e endereço")["id"], "horario")
+
+    def test_invalid_rules_are_rejected_and_previous_kept(self):
+        for rules in (
+            {"rules": []},
+            [{"id": "x", "keywords": "oi", "reply": "a"}],
+            [{"id": "x", "keywords": ["oi"]}],
+            ["oi"],
+        ):
+            with self.assertRaises(ValueError):
+                self.engine.load_rules(rules)
+        self.assertEqual(self.engine.match("oi")["id"], "saudacao")
+
+
+    def test_reload_compiles_off_the_request_thread(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "rules.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"rules": [{"id": "a", "keywords": ["oi"], "reply": "A", "exact": True}]}, f)
+            engine = FastReplyEngine(rules_path=path, reload_interval=0)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"rules": [{"id": "b", "keywords": ["oi"], "reply": "B", "exact": True}]}, f)
+            os.utime(path, (0, 0))
+            with mock.patch("threading.Thread") as thread:
+                engine.maybe_reload()
+                # Até a thread rodar, as regras antigas continuam valendo
+                self.assertEqual(engine.match("oi")["id"], "a")
+                thread.return_value.start.assert_called_once()
+                thread.call_args.kwargs["target"]()
+            self.assertEqual(engine.match("oi")["id"], "b")
+
+
+class LocalMediaStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.storage = LocalMediaStorage(self.tmp_dir.name, max_bytes=10)
+
+    def test_identical_content_is_deduplicated(self):
+        first = self.storage.put_stream([b"abc", b"def"])
+        second = self.storage.put_stream(iter([b"abcdef"]))
+        self.assertEqual(first[0], second[0])
+        self.assertEqual((first[1], first[2]), (6, False))
+        self.assertEqual((second[1], second[2]), (6, True))
+        self.assertTrue(os.path.exists(self.storage.path_for(first[0])))
+
+    def test_size_cap_removes_partial_file(self):
+        with self.assertRaises(MediaTooLargeError):
+            self.storage.put_stream([b"123456", b"78901"])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir.name, "tmp")), [])
+
+
+class WahaMediaUrlTests(SimpleTestCase):
+
+    def setUp(self):
+        with mock.patch.dict(os.environ, {"WAHA_API_URL": "http://waha:3000/"}):
+            self.waha = Waha()
+
+    def test_media_url_is_rebased_on_api_url(self):
+        url = self.waha.internal_media_url("http://localhost:3000/api/files/default/abc.oga?download=1")
+        self.assertEqual(url, "http://waha:3000/api/files/default/abc.oga?download=1")
+
+    def test_media_url_outside_api_is_rejected(self):
+        for media_url in ("http://evil.example/files/abc.oga", "", None):
+            with self.assertRaises(ValueError):
+                self.waha.internal_media_url(media_url)
+
+
+class SupervisorReapTests(SimpleTestCase):
+
+    EXIT_CODE_1 = 1 << 8  # status do waitpid para exit(1)
+
+    def setUp(self):
+        self.supervisor = supervisor.Supervisor(processes=2)
+        self.slot = self.supervisor.slots[0]
+        patcher = mock.patch.object(supervisor.Supervisor, "recover_jobs")
+        self.recover_jobs = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def crash(self, pid: int, started_ago: float = 0.0):
+        self.slot.pid = pid
+        self.slot.started_at = time.time() - started_ago
+        self.supervisor.children[pid] = self.slot
+        with mock.patch("os.waitpid", side_effect=[(pid, self.EXIT_CODE_1), (0, 0)]):
+            self.supervisor.reap_children()
+        return self.supervisor.respawn_at[self.slot.index] - time.monotonic()
+
+    def test_crash_schedules_respawn_with_exponential_backoff(self):
+        first = self.crash(100)
+        second = self.crash(101)
+        third = self.crash(102)
+        self.assertAlmostEqual(first, supervisor.BACKOFF_BASE, delta=0.5)
+        self.assertAlmostEqual(second, supervisor.BACKOFF_BASE * 2, delta=0.5)
+        self.assertAlmostEqual(third, supervisor.BACKOFF_BASE * 4, delta=0.5)
+        self.assertEqual(self.slot.restarts, 3)
+        self.assertIsNone(self.slot.pid)
+
+    def test_backoff_is_capped(self):
+        self.slot.failures = 50
+        self.assertLessEqual(self.crash(100), supervisor.BACKOFF_MAX)
+
+    def test_backoff_resets_after_stable_run(self):
+        self.crash(100)
+        self.crash(101)
+        delay = self.crash(102, started_ago=supervisor.STABLE_SECONDS + 1)
+        self.assertAlmostEqual(delay, supervisor.BACKOFF_BASE, delta=0.5)
+
+    def test_dead_child_jobs_are_recovered(self):
+        self.crash(100)
+        self.recover_jobs.assert_called_once_with(supervisor.get_consumer_id(100))
+
+    def test_rolling_restart_respawns_immediately(self):
+        self.slot.pid = 100
+        self.supervisor.children[100] = self.slot
+        self.supervisor.rolling_slot = self.slot
+        with mock.patch("os.waitpid", side_effect=[(100, 0), (0, 0)]), \
+                mock.patch.object(supervisor.Supervisor, "spawn") as spawn:
+            self.supervisor.reap_children()
+        spawn.assert_called_once_with(self.slot)
+        self.assertIsNone(self.supervisor.rolling_slot)
+        self.assertIs(self.supervisor.waiting_ready, self.slot)
+        self.assertNotIn(self.slot.index, self.supervisor.respawn_at)
+
+    def test_second_sighup_keeps_pending_children(self):
+        roller = supervisor.Supervisor(processes=3)
+        first, second, third = roller.slots
+        for pid, slot in enumerate(roller.slots, start=100):
+            slot.pid = pid
+        # Primeiro filho já reiniciado, segundo drenando, terceiro pendente
+        roller.rolling_slot = second
+        roller.rolling_deadline = time.monotonic() + 60
+        roller.roll_pending = [third]
+        roller._handle_roll(signal.SIGHUP, None)
+        roller.advance_rolling_restart()
+        self.assertEqual(roller.roll_pending, [third, first])
+        self.assertIs(roller.rolling_slot, second)
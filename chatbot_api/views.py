@@ -8,14 +8,13 @@ from django.views.decorators.http import require_POST
 import logging
 from chatbot_api.services.waha_api import Waha
 from chatbot_api.services.redis_client import (
-    get_session_state, 
-    update_session_state,
     add_message_to_history,
-    enqueue_user,
-    is_user_in_queue,
-    publish_new_user,
-    check_and_set_message_id
+    check_and_set_message_id,
+    record_fast_reply_hit,
+    enqueue_media_job
 ) 
+from chatbot_api.services.fast_reply import get_fast_reply_engine
+from chatbot_api.services.dispatch import get_current_step, dispatch_user_message
 
 waha = Waha()
 logger = logging.getLogger(__name__)
@@ -75,35 +74,44 @@ def webhook(request):
         chat_id = message_data.get("from")
         message = message_data.get("body", "").strip().lower() 
         message_id = message_data.get("id")
+        media = message_data.get("media") if message_data.get("hasMedia") else None
 
-        if not message:
+        if not message and not media:
              return JsonResponse({"status": "no_message"}, status=200)
         if not check_and_set_message_id(message_id):
                 logger.info(f"Mensagem {message_id} de {chat_id} duplicada. Ignorando.")
                 return JsonResponse({"status": "duplicate", "message_id": message_id}, status=200)
+
+        # Mídia: apenas os metadados são registrados aqui; o download é feito pelo Worker de mídia,
+        # que encaminha o usuário depois do processamento quando não há texto junto
+        if media:
+            enqueue_media_job(chat_id, message_id, media, dispatch=not message)
+            add_message_to_history(chat_id, "User", f"[mídia: {media.get('mimetype', 'desconhecida')}]")
+            if not message:
+                return JsonResponse({"status": "media_queued", "message_id": message_id}, status=200)
     
         add_message_to_history(chat_id, "User", message)
 
-        session_state = get_session_state(chat_id)
-        current_step = session_state.get('step', 'INICIO') if session_state else 'INICIO'
+        current_step = get_current_step(chat_id)
         logger.info(f"Estado de {chat_id}: {current_step}")
 
-        if current_step == "EM_ATENDIMENTO":
-            publish_new_user(chat_id) # Worker pega a mensagem e continua a conversa
-            return JsonResponse({"status": "success", "step": current_step})
+        # Respostas rápidas: mensagens triviais são respondidas aqui, sem vaga na fila nem Worker
+        if current_step != "EM_ATENDIMENTO":
+            rule = None
+            try:
+                rule = get_fast_reply_engine().match(message)
+            except Exception as e:
+                # Fail-open: um problema nas respostas rápidas nunca impede a mensagem de seguir para a fila
+                logger.error(f"❌ Erro nas respostas rápidas, seguindo para a fila: {e}", exc_info=True)
+            if rule:
+                waha.send_whatsapp_message(chat_id, rule["reply"])
+                add_message_to_history(chat_id, "Bot", rule["reply"])
+                record_fast_reply_hit(rule["id"])
+                logger.info(f"⚡ Resposta rápida '{rule['id']}' enviada para {chat_id}")
+                return JsonResponse({"status": "fast_reply", "rule": rule["id"], "step": current_step})
 
-        elif not is_user_in_queue(chat_id): 
-            new_step = "IN_QUEUE"
-            queue_position = enqueue_user(chat_id)
-            resposta = f" Você está na fila. Posição: {queue_position}. Aguarde o atendimento."
-            waha.send_whatsapp_message(chat_id, resposta)
-            update_session_state(chat_id, step=new_step) # Atualiza o estado
-            if queue_position == 1:
-                publish_new_user(chat_id) # Notifica o worker para iniciar o processamento
-                logger.info("Worker notificado. Novo usuário é o primeiro.")
-            return JsonResponse({"status": "success", "step": current_step})
-        return JsonResponse({"status": "success", "step": current_step})
-                
+        dispatch_user_message(chat_id, waha, current_step)
+        return JsonResponse({"status": "success", "step": current_step})                
     
     except Exception as e:
         logger.error(f"❌ Erro no webhook: {e}", exc_info=True)
@@ -0,0 +1,122 @@
+"""
+Worker independente para ingestão de mídias (imagem, áudio, documento) do WhatsApp
+"""
+import os
+import sys
+import json
+import socket
+import logging
+import threading
+import django
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot.settings')
+os.environ.setdefault('SKIP_WAHA_SESSION_SETUP', '1')  # só o processo web configura o WAHA
+django.setup()
+
+from chatbot_api.services.redis_client import (
+    get_next_media_job, ack_media_job, recover_media_jobs, save_media_record,
+    get_media_transcription, save_media_transcription, add_message_to_history
+)
+from chatbot_api.services.media_storage import LocalMediaStorage, load_transcriber
+from chatbot_api.services.dispatch import dispatch_user_message
+from chatbot_api.services.waha_api import Waha
+
+MEDIA_POOL_SIZE = int(os.getenv('MEDIA_POOL_SIZE', 4))
+MEDIA_CHUNK_SIZE = int(os.getenv('MEDIA_CHUNK_SIZE', 64 * 1024))
+
+waha_api = Waha()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("media-worker")
+
+
+class MediaWorker:
+    def __init__(self, pool_size: int = MEDIA_POOL_SIZE):
+        self.pool_size = pool_size
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.storage = LocalMediaStorage()
+        self.transcriber = load_transcriber()
+        self.pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="media")
+        # Limita jobs em andamento ao tamanho do pool: o restante espera no Redis, não na memória
+        self.slots = threading.BoundedSemaphore(pool_size)
+
+    def process_media(self, raw_job: str):
+        """Ingere a mídia e, se for uma mensagem só de mídia, encaminha o usuário (fila ou Worker)."""
+        job = {}
+        try:
+            job = json.loads(raw_job)
+            self.ingest_media(job)
+            if job.get("dispatch", True):
+                # Mesmo se a ingestão falhar o usuário é encaminhado: ele enviou algo e espera resposta
+                dispatch_user_message(job["chat_id"], waha_api)
+        except Exception as e:
+            logger.error(f"❌ Erro ao encaminhar mídia {job.get('message_id')}: {e}", exc_info=True)
+        finally:
+            try:
+                # Só confirma depois de processar: se o processo morrer antes, o job volta para a fila
+                ack_media_job(self.consumer_id, raw_job)
+            finally:
+                self.slots.release()
+
+    def ingest_media(self, job: dict):
+        """Baixa a mídia em streaming, deduplica por hash e executa o processamento posterior."""
+        chat_id = job["chat_id"]
+        message_id = job["message_id"]
+        mimetype = job.get("mimetype") or ""
+        try:
+            chunks = waha_api.stream_media(job["url"], chunk_size=MEDIA_CHUNK_SIZE)
+            key, size, deduplicated = self.storage.put_stream(chunks)
+            logger.info(f"📥 Mídia {message_id} de {chat_id} armazenada: {key} ({size} bytes)")
+
+            record = {"chat_id": chat_id, "key": key, "size": size, "mimetype": mimetype}
+
+            if self.transcriber and mimetype.startswith("audio/"):
+                sha256 = key.rsplit("/", 1)[-1]
+                text = get_media_transcription(sha256) if deduplicated else None
+                if text:
+                    logger.info(f"📝 Áudio {message_id} já transcrito (conteúdo repetido).")
+                else:
+                    text = self.transcriber(self.storage.path_for(key), mimetype)
+                    if text:
+                        save_media_transcription(sha256, text)
+                        logger.info(f"📝 Áudio {message_id} transcrito.")
+                if text:
+                    record["transcription"] = text
+                    add_message_to_history(chat_id, "User", f"[áudio] {text.strip().lower()}")
+
+            save_media_record(message_id, **record)
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar mídia {message_id} de {chat_id}: {e}", exc_info=True)
+            save_media_record(message_id, chat_id=chat_id, error=str(e))
+
+    def listen_queue(self):
+        """Consome os jobs de mídia com no máximo MEDIA_POOL_SIZE em paralelo"""
+        while True:
+            self.slots.acquire()
+            raw_job = get_next_media_job(self.consumer_id)
+            if not raw_job:
+                self.slots.release()
+                continue
+            self.pool.submit(self.process_media, raw_job)
+
+    def run(self):
+        """Método principal do worker"""
+        logger.info(f"🚀 Media Worker INICIADO - pool de {self.pool_size} threads")
+        recover_media_jobs(socket.gethostname())
+        try:
+            self.listen_queue()
+        except KeyboardInterrupt:
+            logger.info("⏹️ Worker interrompido pelo usuário")
+        finally:
+            self.pool.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    worker = MediaWorker()
+    worker.run()
@@ -0,0 +1,52 @@
+"""
+Worker independente que notifica os usuários da fila quando a posição deles avança
+"""
+import os
+import sys
+import time
+import logging
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot.settings')
+os.environ.setdefault('SKIP_WAHA_SESSION_SETUP', '1')  # só o processo web configura o WAHA
+django.setup()
+
+from chatbot_api.services.queue_broadcast import (
+    run_broadcast_cycle, RateLimiter,
+    BROADCAST_INTERVAL, WAHA_SEND_RATE
+)
+from chatbot_api.services.waha_api import Waha
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("queue-position-worker")
+
+
+class QueuePositionWorker:
+    def __init__(self):
+        self.waha_api = Waha()
+        # O mesmo limitador é compartilhado entre ciclos para não estourar o rate limit na virada
+        self.rate_limiter = RateLimiter(WAHA_SEND_RATE)
+
+    def run(self):
+        """Método principal do worker"""
+        logger.info(f"🚀 Queue Position Worker INICIADO - intervalo de {BROADCAST_INTERVAL}s")
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    run_broadcast_cycle(self.waha_api, self.rate_limiter)
+                except Exception as e:
+                    logger.error(f"❌ Erro no ciclo de broadcast: {e}", exc_info=True)
+                elapsed = time.monotonic() - started
+                time.sleep(max(0.0, BROADCAST_INTERVAL - elapsed))
+        except KeyboardInterrupt:
+            logger.info("⏹️ Worker interrompido pelo usuário")
+
+
+if __name__ == "__main__":
+    worker = QueuePositionWorker()
+    worker.run()
@@ -0,0 +1,383 @@
+"""
+Supervisor prefork: inicia N processos do WhatsApp Worker (padrão: nº de CPUs)
+
+Sinais:
+- SIGTERM / SIGINT: drain gracioso (cada filho termina a mensagem atual e sai)
+- SIGHUP: rolling restart (um filho por vez, só avança quando o novo estiver saudável)
+
+O processo pai NÃO importa o Django nem o código da aplicação: cada filho importa
+o Worker depois do fork, então um rolling restart carrega o código novo e nenhum
+thread do pai é herdado.
+"""
+import os
+import json
+import time
+import socket
+import signal
+import logging
+import argparse
+import threading
+from multiprocessing.sharedctypes import RawArray
+
+import redis
+
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES') or 0) or os.cpu_count() or 1
+DRAIN_TIMEOUT = float(os.getenv('WORKER_DRAIN_TIMEOUT', 30))
+BACKOFF_BASE = float(os.getenv('WORKER_BACKOFF_BASE', 1))
+BACKOFF_MAX = float(os.getenv('WORKER_BACKOFF_MAX', 60))
+STABLE_SECONDS = float(os.getenv('WORKER_STABLE_SECONDS', 30))
+HEARTBEAT_TIMEOUT = float(os.getenv('WORKER_HEARTBEAT_TIMEOUT', 30))
+HEALTH_REPORT_INTERVAL = float(os.getenv('WORKER_HEALTH_REPORT_INTERVAL', 30))
+TICK_SECONDS = 0.5
+
+WORKERS_METRICS_KEY = "metrics:workers"
+
+# Mantidos em sincronia com chatbot_api/services/redis_client.py (o pai não importa a aplicação)
+WORKER_JOBS_KEY = "queue:worker_jobs"
+CHAT_LOCK_KEY = "lock:chat:{}"
+RELEASE_IF_OWNER = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Métricas por filho em memória compartilhada: [processadas, erros, último heartbeat]
+STATS_FIELDS = 3
+STAT_PROCESSED, STAT_ERRORS, STAT_HEARTBEAT = range(STATS_FIELDS)
+
+logger = logging.getLogger("worker-supervisor")
+
+
+class ChildSlot:
+    """Posição fixa do pool; o processo que a ocupa pode ser substituído."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.pid = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restarts = 0
+
+
+def get_consumer_id(pid: int) -> str:
+    """Mesmo formato do WhatsAppWorker.consumer_id."""
+    return f"{socket.gethostname()}:{pid}"
+
+
+def get_processing_key(consumer_id: str) -> str:
+    return f"{WORKER_JOBS_KEY}:processing:{consumer_id}"
+
+
+def run_child(index: int, stats) -> int:
+    """Ponto de entrada do processo filho. Retorna o exit code."""
+    worker = None
+    base = index * STATS_FIELDS
+    stopped = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"⏹️ Filho {index} (pid {os.getpid()}) recebeu sinal {signum}. Finalizando...")
+        if worker is not None:
+            worker.stop()
+        else:
+            raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    def heartbeat():
+        # Thread próprio: jobs longos (WAHA, geração de resposta) não param o heartbeat
+        while not stopped.is_set():
+            stats[base + STAT_HEARTBEAT] = time.time()
+            stopped.wait(1)
+
+    def on_result(ok: bool):
+        stats[base + (STAT_PROCESSED if ok else STAT_ERRORS)] += 1
+
+    # Importado só no filho: cada (re)start carrega o código atual e inicializa o Django aqui
+    from whatsapp_worker import WhatsAppWorker
+
+    worker = WhatsAppWorker()
+    threading.Thread(target=heartbeat, daemon=True).start()
+    logger.info(f"🚀 Filho {index} iniciado (pid {os.getpid()})")
+    try:
+        worker.listen_queue(on_result=on_result)
+    finally:
+        stopped.set()
+    return 0
+
+
+class Supervisor:
+    def __init__(self, processes: int = WORKER_PROCESSES):
+        self.slots = [ChildSlot(i) for i in range(processes)]
+        self.stats = RawArray('d', processes * STATS_FIELDS)
+        self.children = {}  # pid -> ChildSlot
+        self.respawn_at = {}  # index -> horário do próximo start (backoff)
+        self.stopping = False
+        self.roll_requested = False
+        self.roll_pending = []
+        self.rolling_slot = None
+        self.rolling_deadline = 0.0
+        self.waiting_ready = None
+        self.last_report = time.monotonic()
+        self._redis = None
+
+    def get_redis(self):
+        """Conexão própria do supervisor (configurada pelo ambiente, sem Django)."""
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=os.getenv('REDIS_HOST', 'localhost'),
+                port=int(os.getenv('REDIS_PORT', 6379)),
+                db=int(os.getenv('REDIS_DB', 0)),
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+            )
+        return self._redis
+
+    def recover_jobs(self, consumer_id: str) -> int:
+        """
+        Devolve para o início da fila os jobs que o consumidor (filho morto) não confirmou
+        e libera os locks de chat que ele ainda segurava.
+        """
+        try:
+            r = self.get_redis()
+            recovered = 0
+            while True:
+                chat_id = r.lmove(get_processing_key(consumer_id), WORKER_JOBS_KEY, "RIGHT", "LEFT")
+                if chat_id is None:
+                    break
+                r.eval(RELEASE_IF_OWNER, 1, CHAT_LOCK_KEY.format(chat_id), consumer_id)
+                recovered += 1
+            if recovered:
+                logger.warning(f"♻️ {recovered} job(s) de {consumer_id} devolvidos para a fila.")
+            return recovered
+        except Exception as e:
+            logger.error(f"❌ Não foi possível recuperar os jobs de {consumer_id}: {e}")
+            return 0
+
+    def recover_orphaned_jobs(self):
+        """Na inicialização: recupera listas de processamento deixadas por uma execução anterior neste host."""
+        try:
+            pattern = get_processing_key(get_consumer_id("*"))
+            for key in self.get_redis().scan_iter(match=pattern):
+                self.recover_jobs(key[len(get_processing_key("")):])
+        except Exception as e:
+            logger.error(f"❌ Não foi possível verificar jobs órfãos: {e}")
+
+    # --- Ciclo de vida dos filhos ---
+
+    def spawn(self, slot: ChildSlot):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = run_child(slot.index, self.stats)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            except BaseException as e:
+                logger.error(f"💥 Erro fatal no filho {slot.index}: {e}", exc_info=True)
+            finally:
+                os._exit(code)
+
+        slot.pid = pid
+        slot.started_at = time.time()
+        self.children[pid] = slot
+        self.respawn_at.pop(slot.index, None)
+        logger.info(f"👶 Filho {slot.index} criado (pid {pid})")
+
+    def reap_children(self):
+        """Coleta filhos encerrados (sem bloquear) e agenda o restart quando necessário."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.children.pop(pid, None)
+            if slot is None:
+                continue
+            slot.pid = None
+            exit_code = os.waitstatus_to_exitcode(status)
+            # Um filho que saiu limpo não tem jobs pendentes; se morreu no meio de um, o job volta à fila
+            self.recover_jobs(get_consumer_id(pid))
+
+            if self.stopping:
+                logger.info(f"Filho {slot.index} (pid {pid}) encerrado: {exit_code}")
+            elif slot is self.rolling_slot:
+                logger.info(f"🔄 Filho {slot.index} (pid {pid}) drenado. Iniciando substituto...")
+                self.rolling_slot = None
+                self.waiting_ready = slot
+                slot.restarts += 1
+                self.spawn(slot)
+            else:
+                now = time.time()
+                if now - slot.started_at >= STABLE_SECONDS:
+                    slot.failures = 0
+                slot.failures += 1
+                slot.restarts += 1
+                delay = min(BACKOFF_BASE * 2 ** (slot.failures - 1), BACKOFF_MAX)
+                self.respawn_at[slot.index] = time.monotonic() + delay
+                logger.warning(f"⚠️ Filho {slot.index} (pid {pid}) caiu com código {exit_code}. Reiniciando em {delay:.1f}s")
+
+    def respawn_due(self):
+        now = time.monotonic()
+        for index, due in list(self.respawn_at.items()):
+            if now >= due:
+                self.spawn(self.slots[index])
+
+    def is_ready(self, slot: ChildSlot) -> bool:
+        """O filho está pronto quando já enviou um heartbeat depois de iniciar."""
+        return slot.pid is not None and self.stats[slot.index * STATS_FIELDS + STAT_HEARTBEAT] >= slot.started_at
+
+    # --- Rolling restart ---
+
+    def advance_rolling_restart(self):
+        if self.roll_requested:
+            self.roll_requested = False
+            # Acrescenta (não substitui): um SIGHUP no meio do rolling não descarta quem ainda está pendente
+            self.roll_pending += [slot for slot in self.slots if slot not in self.roll_pending and slot is not self.rolling_slot]
+            logger.info(f"🔁 Rolling restart solicitado ({len(self.roll_pending)} filhos)")
+
+        if self.rolling_slot is not None:
+            if time.monotonic() > self.rolling_deadline and self.rolling_slot.pid:
+                logger.warning(f"Filho {self.rolling_slot.index} não drenou a tempo. Enviando SIGKILL.")
+                self._signal(self.rolling_slot.pid, signal.SIGKILL)
+            return
+        if self.waiting_ready is not None:
+            if not self.is_ready(self.waiting_ready) and self.waiting_ready.pid:
+                return
+            self.waiting_ready = None
+
+        while self.roll_pending:
+            slot = self.roll_pending.pop(0)
+            if slot.pid is None:
+                continue
+            self.rolling_slot = slot
+            self.rolling_deadline = time.monotonic() + DRAIN_TIMEOUT
+            self._signal(slot.pid, signal.SIGTERM)
+            return
+
+    # --- Health e métricas ---
+
+    def check_health(self):
+        """Mata (SIGKILL) filhos sem heartbeat recente; eles são reiniciados como crash."""
+        now = time.time()
+        for slot in self.slots:
+            if slot.pid is None or slot is self.rolling_slot:
+                continue
+            last_seen = max(self.stats[slot.index * STATS_FIELDS + STAT_HEARTBEAT], slot.started_at)
+            if now - last_seen > HEARTBEAT_TIMEOUT:
+                logger.error(f"💀 Filho {slot.index} (pid {slot.pid}) sem heartbeat há {now - last_seen:.0f}s. Enviando SIGKILL.")
+                self._signal(slot.pid, signal.SIGKILL)
+
+    def health_snapshot(self) -> dict:
+        now = time.time()
+        children = []
+        for slot in self.slots:
+            base = slot.index * STATS_FIELDS
+            heartbeat = self.stats[base + STAT_HEARTBEAT]
+            children.append({
+                "index": slot.index,
+                "pid": slot.pid,
+                "alive": slot.pid is not None,
+                "uptime": round(now - slot.started_at, 1) if slot.pid else 0,
+                "restarts": slot.restarts,
+                "processed": int(self.stats[base + STAT_PROCESSED]),
+                "errors": int(self.stats[base + STAT_ERRORS]),
+                "heartbeat_age": round(now - heartbeat, 1) if heartbeat else None,
+            })
+        return {
+            "supervisor_pid": os.getpid(),
+            "alive": sum(1 for child in children if child["alive"]),
+            "processes": len(self.slots),
+            "processed": sum(child["processed"] for child in children),
+            "errors": sum(child["errors"] for child in children),
+            "children": children,
+        }
+
+    def report_health(self, force: bool = False):
+        if not force and time.monotonic() - self.last_report < HEALTH_REPORT_INTERVAL:
+            return
+        self.last_report = time.monotonic()
+        snapshot = self.health_snapshot()
+        logger.info(f"📊 Workers: {snapshot['alive']}/{snapshot['processes']} vivos, processadas={snapshot['processed']} erros={snapshot['errors']}")
+        try:
+            self.get_redis().hset(WORKERS_METRICS_KEY, mapping={
+                "total": json.dumps({k: v for k, v in snapshot.items() if k != "children"}),
+                **{f"child:{child['index']}": json.dumps(child) for child in snapshot["children"]},
+            })
+        except Exception as e:
+            logger.warning(f"Não foi possível publicar as métricas dos workers no Redis: {e}")
+
+    # --- Sinais e loop principal ---
+
+    def _signal(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _handle_stop(self, signum, frame):
+        logger.info(f"⏹️ Supervisor recebeu sinal {signum}. Iniciando drain...")
+        self.stopping = True
+
+    def _handle_roll(self, signum, frame):
+        self.roll_requested = True
+
+    def drain(self):
+        """Repassa SIGTERM aos filhos e espera até DRAIN_TIMEOUT antes de forçar o encerramento."""
+        for pid in list(self.children):
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap_children()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning(f"Filho pid {pid} não drenou a tempo. Enviando SIGKILL.")
+            self._signal(pid, signal.SIGKILL)
+        while self.children:
+            pid, _ = os.waitpid(-1, 0)
+            if self.children.pop(pid, None) is not None:
+                self.recover_jobs(get_consumer_id(pid))
+
+    def run(self):
+        """Método principal do supervisor"""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_roll)
+
+        logger.info(f"🚀 Supervisor INICIADO (pid {os.getpid()}) com {len(self.slots)} processos")
+        # Herdado pelos filhos: só o processo web reconfigura a sessão do WAHA no django.setup()
+        os.environ['SKIP_WAHA_SESSION_SETUP'] = '1'
+        self.recover_orphaned_jobs()
+        for slot in self.slots:
+            self.spawn(slot)
+
+        while not self.stopping:
+            self.reap_children()
+            if self.stopping:
+                break
+            self.advance_rolling_restart()
+            self.respawn_due()
+            self.check_health()
+            self.report_health()
+            time.sleep(TICK_SECONDS)
+
+        self.drain()
+        self.report_health(force=True)
+        logger.info("✅ Supervisor finalizado.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Supervisor prefork do WhatsApp Worker")
+    parser.add_argument("--processes", "-n", type=int, default=WORKER_PROCESSES,
+                        help="Quantidade de processos (padrão: WORKER_PROCESSES ou nº de CPUs)")
+    args = parser.parse_args()
+    Supervisor(max(1, args.processes)).run()
@@ -3,17 +3,22 @@ Worker independente para processar fila do WhatsApp - VERSÃO CORRIGIDA
 """
 import os
 import sys
+import socket
 import logging
 import django
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot.settings')
+os.environ.setdefault('SKIP_WAHA_SESSION_SETUP', '1')  # só o processo web configura o WAHA
 django.setup() 
 
 from chatbot_api.services.redis_client import (
     update_session_state,
     add_message_to_history, get_recent_history,
-    publish_new_user, enqueue_user, get_redis_client
+    publish_new_user, enqueue_user, get_redis_client,
+    get_next_worker_job, ack_worker_job, remove_user_from_queue,
+    acquire_chat_lock, release_chat_lock,
+    mark_chat_pending, clear_chat_pending, has_chat_pending
 )
 from chatbot_api.services.waha_api import Waha
 # from chatbot_api.services.ia_service import agent_register
@@ -36,6 +41,9 @@ logger = logging.getLogger("whatsapp-worker")
 class WhatsAppWorker:
     def __init__(self):
         self.redis_client = None
+        self.running = True
+        # Identifica a lista de processamento e o dono dos locks deste processo
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}"
         self.setup_connections()
         self.redis_client = get_redis_client()
         # self.agent_register = agent_register()
@@ -55,6 +63,10 @@ class WhatsAppWorker:
         try:
             
             update_session_state(chat_id, step="EM_ATENDIMENTO")
+            # Sai da fila de espera: as posições dos demais avançam e o novo primeiro vai para o Worker
+            next_chat_id = remove_user_from_queue(chat_id)
+            if next_chat_id:
+                publish_new_user(next_chat_id)
             logger.info(f" Estado atualizado para EM_ATENDIMENTO: {chat_id}")
             
             history = get_recent_history(chat_id, limit=10)
@@ -63,7 +75,7 @@ class WhatsAppWorker:
             waha_api.send_whatsapp_message(chat_id, response)
             logger.info(f"Resposta gerada e enviada via WAHA: {chat_id}")
             add_message_to_history(chat_id, "Bot", response)
-
+            return True
             
         except Exception as e:
             logger.error(f"❌ Erro ao processar {chat_id}: {e}", exc_info=True)
@@ -74,6 +86,7 @@ class WhatsAppWorker:
                 logger.info(f"🔄 Usuário re-adicionado na fila: {chat_id}")
             except Exception as retry_error:
                 logger.error(f"💥 Erro ao re-adicionar na fila: {retry_error}")
+            return False
 
     def generate_response(self, chat_id: str, history: list) -> str: # chat_id opcional
         """Gera resposta baseada no histórico"""
@@ -85,15 +98,51 @@ class WhatsAppWorker:
         logger.info(f"Resposta generate_ia enviada via WAHA: {response_example}")
         return response_example
 
-    def listen_queue(self):
-        """Fica escutando notificações da fila via Redis Pub/Sub"""
-        pubsub = self.redis_client.pubsub()
-        pubsub.subscribe("new_user_queue")
-        for message in pubsub.listen():
-            if message['type'] == 'message':
-                chat_id = message['data']
-                logger.info(f"📨 Nova notificação recebida: {chat_id}")
-                self.process_user_message(chat_id)
+    def stop(self):
+        """Pede o encerramento gracioso: a mensagem em andamento é concluída antes de sair"""
+        self.running = False
+
+    def handle_job(self, chat_id: str):
+        """
+        Processa o chat com lock por chat: dois processos nunca atendem o mesmo chat ao
+        mesmo tempo. Se o chat já está em atendimento, marca como pendente e o dono do lock
+        processa de novo ao terminar (as mensagens novas já estão no histórico).
+
+        :return: resultado de process_user_message, ou None se ficou com outro processo.
+        """
+        ok = None
+        while True:
+            if not acquire_chat_lock(chat_id, self.consumer_id):
+                mark_chat_pending(chat_id)
+                # O dono pode ter liberado entre as duas chamadas: tenta de novo antes de desistir
+                if not acquire_chat_lock(chat_id, self.consumer_id):
+                    logger.info(f"⏸️ {chat_id} já está em atendimento em outro processo. Marcado como pendente.")
+                    return ok
+            try:
+                clear_chat_pending(chat_id)
+                ok = self.process_user_message(chat_id)
+            finally:
+                release_chat_lock(chat_id, self.consumer_id)
+            if not has_chat_pending(chat_id):
+                return ok
+
+    def listen_queue(self, on_result=None):
+        """
+        Consome as notificações da lista de jobs (BLMOVE para a lista de processamento
+        deste processo), uma por vez. `on_result(ok)` é chamado após cada mensagem
+        processada (usado pelo supervisor para métricas).
+        """
+        while self.running:
+            chat_id = get_next_worker_job(self.consumer_id, timeout=1)
+            if not chat_id:
+                continue
+            logger.info(f"📨 Nova notificação recebida: {chat_id}")
+            try:
+                ok = self.handle_job(chat_id)
+            finally:
+                ack_worker_job(self.consumer_id, chat_id)
+            if on_result and ok is not None:
+                on_result(ok)
 
     def run(self):
         """Método principal do worker"""